@@ -1,5 +1,7 @@
 """ Implements adaptive random walks on CDSs. """
-from typing import Callable, List, Optional
+import concurrent.futures
+from typing import Callable, Optional
+import numpy as np
 import protein
 import random
 import dataclasses
@@ -9,40 +11,121 @@ import dataclasses
 class WalkConfig:
     aa_seq: str
     freq_table: protein.CodonFrequencyTable
-    objective: Callable[[List[str]], float]
+    objective: Callable[..., float]
     steps: int
-    init_cds: Optional[List[str]] = None
+    init_cds: Optional[np.ndarray] = None
     verbose: bool = False
+    seed: Optional[int] = None
+    # When > 0 and the objective exposes a prefetch hook, each step scores
+    # the whole codon neighborhood of the chosen position (steepest ascent)
+    # with Vienna calls overlapped across this many threads.
+    neighbor_workers: int = 0
 
 
 @dataclasses.dataclass
 class WalkResult:
-    cds: List[str]
+    cds: np.ndarray
     fitness: float
 
 
 def adaptive_random_walk(config: WalkConfig):
     """Runs ARW to maximize objective function on CDSs."""
+    # Walk-local generator: avoids the shared module state and lets each
+    # parallel restart seed independently. _randbelow skips the range
+    # bookkeeping that randrange redoes on every call.
+    rng = random.Random(config.seed)
+    rand_below = rng._randbelow
     cds = protein.random_cds(
-        config.aa_seq, config.freq_table) if config.init_cds is None else config.init_cds
+        config.aa_seq, config.freq_table, rng) if config.init_cds is None else protein.encode_cds(config.init_cds)
+    # Positions with a synonymous alternative and their codon-index choices,
+    # computed once instead of rebuilt from sets on every step.
+    codons_tuple = config.freq_table.codons_tuple
+    mut_pos = [i for i, aa in enumerate(config.aa_seq)
+               if len(codons_tuple[aa]) > 1]
+    alts = [tuple(protein.codon_index(c)
+                  for c in codons_tuple[config.aa_seq[i]])
+            for i in mut_pos]
+    codon_to_slot = config.freq_table.codon_to_slot
     prev_fitness = config.objective(cds)
-    if config.verbose:
-        print(f"Initial CDS: {cds}")
-    for step in range(config.steps):
-        mutidx = random.randint(0, len(cds) - 1)
-        while len(config.freq_table.get_codons(config.aa_seq[mutidx])) == 1:
-            mutidx = random.randint(0, len(cds) - 1)
-        mutcodons = list(config.freq_table.get_codons(
-            config.aa_seq[mutidx])-set([cds[mutidx]]))
-        mutcodon = random.choice(mutcodons)
-        new_cds = cds[:mutidx] + [mutcodon] + cds[mutidx+1:]
-        new_fitness = config.objective(new_cds)
-        if new_fitness > prev_fitness:
-            cds = new_cds
-            prev_fitness = new_fitness
+    # Objectives with incremental state expose a revert hook for rejections
+    # and a prefetch hook for threaded neighborhood evaluation.
+    revert = getattr(config.objective, 'revert', None)
+    prefetch = getattr(config.objective, 'prefetch', None)
+    executor = None
+    if config.neighbor_workers > 0 and prefetch is not None:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.neighbor_workers)
+    try:
+        for step in range(config.steps):
+            k = rand_below(len(mut_pos))
+            mutidx = mut_pos[k]
+            choices = alts[k]
+            old_codon = int(cds[mutidx])
+            if executor is None:
+                # Draw over the len-1 non-current codons, stepping past the
+                # current codon's sorted slot, so no comparison against codon
+                # values at all.
+                j = rand_below(len(choices) - 1)
+                mutcodon = choices[j + (j >= codon_to_slot[old_codon])]
+                # Mutate in place; restored on reject. Avoids an O(L) copy
+                # per step.
+                cds[mutidx] = mutcodon
+                new_fitness = config.objective(
+                    cds, mutidx, old_codon, best_so_far=prev_fitness)
+                if new_fitness > prev_fitness:
+                    prev_fitness = new_fitness
+                    if config.verbose:
+                        print(f"New CDS: {protein.decode_cds(cds)}")
+                else:
+                    cds[mutidx] = old_codon
+                    if revert is not None:
+                        revert()
+            else:
+                new_fitness = _neighborhood_step(
+                    config, cds, mutidx, old_codon, choices, prev_fitness,
+                    revert, prefetch, executor)
+                if new_fitness > prev_fitness:
+                    prev_fitness = new_fitness
+                    if config.verbose:
+                        print(f"New CDS: {protein.decode_cds(cds)}")
             if config.verbose:
-                print(f"New CDS: {new_cds}")
-        if config.verbose:
-            print(
-                f"Step: {step}, Fitness: {new_fitness}, Best Fitness: {prev_fitness}")
+                print(
+                    f"Step: {step}, Fitness: {new_fitness}, Best Fitness: {prev_fitness}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
     return WalkResult(cds, prev_fitness)
+
+
+def _neighborhood_step(config, cds, mutidx, old_codon, choices, prev_fitness,
+                       revert, prefetch, executor):
+    """Scores every alternative codon at mutidx and applies the best one.
+
+    Vienna's partition-function calls release the GIL, so warming its cache
+    across threads overlaps the expensive work; the objective itself is then
+    evaluated sequentially (on cache hits) to keep its state single-threaded.
+    Leaves cds holding the best improving codon, or old_codon if none."""
+    others = [c for c in choices if c != old_codon]
+    candidates = []
+    for c in others:
+        cand = cds.copy()
+        cand[mutidx] = c
+        candidates.append(cand)
+    list(executor.map(prefetch, candidates))
+    best_codon = None
+    best_fitness = prev_fitness
+    for c in others:
+        cds[mutidx] = c
+        fitness = config.objective(
+            cds, mutidx, old_codon, best_so_far=prev_fitness)
+        if fitness > best_fitness:
+            best_fitness = fitness
+            best_codon = c
+        cds[mutidx] = old_codon
+        if revert is not None:
+            revert()
+    if best_codon is None:
+        return best_fitness
+    cds[mutidx] = best_codon
+    # Re-evaluate to sync incremental objective state; served from cache.
+    return config.objective(cds, mutidx, old_codon, best_so_far=prev_fitness)
@@ -2,11 +2,84 @@
 from typing import Callable, List
 import math
 import dataclasses
+import numpy as np
 import vienna
 import protein
 
 
 
+class VariableRegionCache:
+    """Caches per-sequence results keyed only by codons at variable positions.
+
+    Single-codon AAs produce identical nucleotides in every candidate CDS of
+    a walk, so hashing them adds cost without distinguishing anything. The
+    key is the packed bytes of the mutable positions; eviction is FIFO."""
+
+    def __init__(self, freq_table: protein.CodonFrequencyTable, maxsize=4096):
+        self.freq_table = freq_table
+        self.maxsize = maxsize
+        self.cache = {}
+        self.mask = None
+
+    def key(self, cds):
+        """Cache key for a packed CDS, or None when cds is not cacheable."""
+        if not isinstance(cds, np.ndarray):
+            return None
+        if self.mask is None or self.mask.size != cds.size:
+            table = self.freq_table
+            n_codons = np.diff(table.aa_codon_offsets)[
+                table.codon_to_aa_idx[cds]]
+            self.mask = n_codons > 1
+            self.cache.clear()
+        return cds[self.mask].tobytes()
+
+    def get(self, key):
+        return None if key is None else self.cache.get(key)
+
+    def put(self, key, value):
+        if key is None:
+            return
+        if len(self.cache) >= self.maxsize:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = value
+
+
+class CAITracker:
+    """Maintains a running log-CAI sum across single-codon mutations.
+
+    CAI is a geometric mean of per-codon weights, so a one-codon swap only
+    changes one log term. Evaluating a mutation is O(1) instead of O(L);
+    the walk calls revert() when it rejects the mutation."""
+
+    def __init__(self, freq_table: protein.CodonFrequencyTable):
+        self.freq_table = freq_table
+        self.log_sum = None
+        self.length = 0
+        self.last_delta = 0.0
+
+    def cai(self, cds, mutidx=None, old_codon=None) -> float:
+        log_weights = self.freq_table.log_cai_weights
+        if mutidx is None or self.log_sum is None or len(cds) != self.length:
+            self.log_sum = float(
+                log_weights[protein.as_codon_indices(cds)].sum())
+            self.length = len(cds)
+            self.last_delta = 0.0
+        else:
+            new_codon = cds[mutidx]
+            if isinstance(new_codon, str):
+                new_codon = protein.codon_index(new_codon)
+                old_codon = protein.codon_index(old_codon)
+            self.last_delta = float(
+                log_weights[new_codon] - log_weights[old_codon])
+            self.log_sum += self.last_delta
+        return math.exp(self.log_sum / self.length)
+
+    def revert(self):
+        """Undoes the last mutation's contribution to the running sum."""
+        self.log_sum -= self.last_delta
+        self.last_delta = 0.0
+
+
 @dataclasses.dataclass
 class CAIThresholdObjectiveConfig:
     """Configuration for CAI threshold objective function."""
@@ -16,42 +89,105 @@ class CAIThresholdObjectiveConfig:
     verbose: bool = False
 
 
-def make_cai_threshold_obj(config: CAIThresholdObjectiveConfig) -> Callable[[List[str]], float]:
+def make_cai_threshold_obj(config: CAIThresholdObjectiveConfig) -> Callable[..., float]:
     """Optimises CAI up to the threshold"""
-    def obj(cds: List[str]) -> float:
-        cai = config.freq_table.codon_adaptation_index(cds)
-        cai_penalty = math.exp(
-            max(0, config.cai_threshold-cai)*config.cai_exp_scale)-1
+    tracker = CAITracker(config.freq_table)
+
+    def obj(cds: List[str], mutidx=None, old_codon=None, best_so_far=None) -> float:
+        cai = tracker.cai(cds, mutidx, old_codon)
+        # Skip the libm exp() in the converged regime where CAI has met
+        # the threshold and the penalty is exactly zero.
+        d = config.cai_threshold-cai
+        cai_penalty = math.exp(d*config.cai_exp_scale)-1 if d > 0 else 0.0
         if config.verbose:
             print(f"-- Obj fn log. CAI: {cai}")
         return -cai_penalty
+    obj.revert = tracker.revert
     return obj
 
 
-def make_cai_and_aup_obj(config: CAIThresholdObjectiveConfig) -> Callable[[List[str]], float]:
+def make_cai_and_aup_obj(config: CAIThresholdObjectiveConfig) -> Callable[..., float]:
     """Optimises CAI and AUP: (1-aup)-(e^(max(0,threshold-cai)*scale)-1)"""
-    def obj(cds: List[str]) -> float:
-        rna_seq = vienna.cds_to_rna(cds)
-        cai = config.freq_table.codon_adaptation_index(cds)
-        cai_penalty = math.exp(
-            max(0, config.cai_threshold-cai)*config.cai_exp_scale)-1
-        aup = vienna.average_unpaired(rna_seq)
+    tracker = CAITracker(config.freq_table)
+    cache = VariableRegionCache(config.freq_table)
+
+    def obj(cds: List[str], mutidx=None, old_codon=None, best_so_far=None) -> float:
+        cai = tracker.cai(cds, mutidx, old_codon)
+        # Skip the libm exp() in the converged regime where CAI has met
+        # the threshold and the penalty is exactly zero.
+        d = config.cai_threshold-cai
+        cai_penalty = math.exp(d*config.cai_exp_scale)-1 if d > 0 else 0.0
+        # Paired probability is at most 1, so when even a fully paired
+        # ensemble cannot beat the current best the partition function
+        # is skipped outright. CAI costs microseconds; ViennaRNA seconds.
+        if best_so_far is not None and 1-cai_penalty <= best_so_far:
+            if config.verbose:
+                print(f"-- Obj fn log. CAI: {cai}, skipped (CAI bound)")
+            return -math.inf
+        key = cache.key(cds)
+        aup = cache.get(key)
+        if aup is None:
+            aup = vienna.average_unpaired(vienna.cds_to_rna(cds))
+            cache.put(key, aup)
         ensemble_paired_prob = 1-aup
         if config.verbose:
             print(f"-- Obj fn log. CAI: {cai}, AUP: {aup}")
         return ensemble_paired_prob - cai_penalty
+
+    def prefetch(cds):
+        """Warms the Vienna cache for cds; used by threaded neighborhood steps."""
+        vienna.average_unpaired(vienna.cds_to_rna(cds))
+    obj.revert = tracker.revert
+    obj.prefetch = prefetch
     return obj
 
 
-def make_cai_and_efe_obj(config: CAIThresholdObjectiveConfig) -> Callable[[List[str]], float]:
+def make_cai_and_efe_obj(config: CAIThresholdObjectiveConfig) -> Callable[..., float]:
     """Optimises CAI and EFE: -efe*(1/e^(max(0,threshold-cai)*scale))"""
-    def obj(cds: List[str]) -> float:
-        rna_seq = vienna.cds_to_rna(cds)
-        cai = config.freq_table.codon_adaptation_index(cds)
-        cai_penalty = math.exp(
-            max(0, config.cai_threshold-cai)*config.cai_exp_scale)
-        efe = vienna.ensemble_free_energy(rna_seq)
+    tracker = CAITracker(config.freq_table)
+    cache = VariableRegionCache(config.freq_table)
+    neg_efe_cap = None
+
+    def obj(cds: List[str], mutidx=None, old_codon=None, best_so_far=None) -> float:
+        nonlocal neg_efe_cap
+        cai = tracker.cai(cds, mutidx, old_codon)
+        d = config.cai_threshold-cai
+        cai_penalty = math.exp(d*config.cai_exp_scale) if d > 0 else 1.0
+        # Best -EFE seen so far caps what this candidate can plausibly
+        # score; if that still loses to the current best, skip ViennaRNA.
+        if best_so_far is not None and neg_efe_cap is not None \
+                and neg_efe_cap/cai_penalty <= best_so_far:
+            if config.verbose:
+                print(f"-- Obj fn log. CAI: {cai}, skipped (CAI bound)")
+            return -math.inf
+        key = cache.key(cds)
+        efe = cache.get(key)
+        if efe is None:
+            efe = vienna.ensemble_free_energy(vienna.cds_to_rna(cds))
+            cache.put(key, efe)
+        if neg_efe_cap is None or -efe > neg_efe_cap:
+            neg_efe_cap = -efe
         if config.verbose:
             print(f"-- Obj fn log. CAI: {cai}, EFE: {efe}")
         return -efe * (1/cai_penalty)
+
+    def prefetch(cds):
+        """Warms the Vienna cache for cds; used by threaded neighborhood steps."""
+        vienna.ensemble_free_energy(vienna.cds_to_rna(cds))
+    obj.revert = tracker.revert
+    obj.prefetch = prefetch
     return obj
+
+
+def make_objective(stability: str, config: CAIThresholdObjectiveConfig) -> Callable[..., float]:
+    """Builds the objective function for the given stability type ('aup', 'efe' or 'none').
+
+    Factory closures are not picklable, so parallel workers call this to
+    rebuild the objective from the config inside each process."""
+    if stability == 'aup':
+        return make_cai_and_aup_obj(config)
+    if stability == 'efe':
+        return make_cai_and_efe_obj(config)
+    if stability == 'none':
+        return make_cai_threshold_obj(config)
+    raise ValueError(f"Unknown stability objective: {stability}")
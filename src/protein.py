@@ -1,6 +1,8 @@
 """ This module contains code for dealing with amino acid sequence and coding sequence (CDS) data. """
 import math
 import dataclasses
+import numba
+import numpy as np
 
 AA_SINGLE_LETTER = {
     "Ala": "A",
@@ -31,14 +33,83 @@ def is_valid_aa_letter(aa):
     return aa in AA_SINGLE_LETTER.values() and aa != '*'
 
 
+# Maps each nucleotide to 2 bits, so a codon maps to a 6-bit index.
+NT_BITS = {'A': 0, 'C': 1, 'G': 2, 'U': 3}
+# Byte-indexed version for vectorized encoding of whole sequences.
+_NT_BITS_LUT = np.zeros(128, dtype=np.int32)
+for _nt, _bits in NT_BITS.items():
+    _NT_BITS_LUT[ord(_nt)] = _bits
+
+
+def codon_index(codon: str) -> int:
+    """Returns the 6-bit index of a codon (A/C/G/U -> 0..3, 2 bits each)."""
+    return (NT_BITS[codon[0]] << 4) | (NT_BITS[codon[1]] << 2) | NT_BITS[codon[2]]
+
+
+# Codon string for each of the 64 possible 6-bit indices.
+CODON_BY_INDEX = ['ACGU'[(i >> 4) & 3] + 'ACGU'[(i >> 2) & 3] + 'ACGU'[i & 3]
+                  for i in range(64)]
+# Same table as raw nucleotide bytes, so a packed CDS turns into an RNA
+# string with one gather and one decode.
+CODON_BYTES = np.frombuffer(
+    ''.join(CODON_BY_INDEX).encode(), dtype=np.uint8).reshape(64, 3)
+
+
+def cds_to_indices(cds) -> np.ndarray:
+    """Encodes a CDS as an int32 array of 6-bit codon indices."""
+    nts = np.frombuffer(''.join(cds).encode(), dtype=np.uint8)
+    bits = _NT_BITS_LUT[nts]
+    return (bits[0::3] << 4) | (bits[1::3] << 2) | bits[2::3]
+
+
+def as_codon_indices(cds) -> np.ndarray:
+    """Accepts a packed codon-index array or a list of codon strings."""
+    if isinstance(cds, np.ndarray):
+        return cds
+    return cds_to_indices(cds)
+
+
+def encode_cds(cds) -> np.ndarray:
+    """Packs a CDS into a uint8 array of 6-bit codon indices (1 byte/codon).
+
+    Mutating a packed CDS is a scalar store and copying it is a memcpy,
+    unlike the list-of-strings form."""
+    return as_codon_indices(cds).astype(np.uint8)
+
+
+def decode_cds(arr) -> list[str]:
+    """Inverse of encode_cds: packed index array back to codon strings."""
+    return [CODON_BY_INDEX[i] for i in arr]
+
+
+@numba.njit(cache=True)
+def _random_cds(aa_arr, offsets, flat, seed):
+    np.random.seed(seed)
+    out = np.empty(aa_arr.size, dtype=np.uint8)
+    for i in range(aa_arr.size):
+        a = aa_arr[i]
+        lo = offsets[a]
+        out[i] = flat[lo + np.random.randint(0, offsets[a + 1] - lo)]
+    return out
+
+
+@numba.njit(cache=True)
+def _log_cai(idx, weights):
+    s = 0.0
+    for i in range(idx.size):
+        s += math.log(weights[idx[i]])
+    return s / idx.size
+
+
 class CodonFrequencyTable:
     def __init__(self, table_path):
         file = open(table_path, 'r')
         self.codons = set()
         self.codon_to_aa = {}
         self.aa_to_codons = {}
-        self.codon_freq = {}
-        self.aa_max_freq = {}
+        # Codon frequencies go straight into a flat table keyed by the 6-bit
+        # codon index: O(1) lookups with no dict in any hot path.
+        self.freq_by_idx = np.zeros(64, dtype=np.float32)
         # The format uses T instead of U
         self.nt_map = {'A': 'A', 'T': 'U', 'C': 'C', 'G': 'G'}
         for line in file:
@@ -48,23 +119,55 @@ class CodonFrequencyTable:
             aa = tokens[0]
             aa = AA_SINGLE_LETTER[aa]
             codon = ''.join([self.nt_map[nt] for nt in tokens[1]])
-            freq = round(float(tokens[2]))
             self.codons.add(codon)
             self.codon_to_aa[codon] = aa
             if aa not in self.aa_to_codons:
                 self.aa_to_codons[aa] = set()
             self.aa_to_codons[aa].add(codon)
-            self.codon_freq[codon] = freq
-            if aa not in self.aa_max_freq:
-                self.aa_max_freq[aa] = 0
-            self.aa_max_freq[aa] = max(self.aa_max_freq[aa], freq)
+            self.freq_by_idx[codon_index(codon)] = round(float(tokens[2]))
         file.close()
+        self.aa_list = sorted(self.aa_to_codons)
+        self.aa_index = {aa: i for i, aa in enumerate(self.aa_list)}
+        # AA index of each codon; -1 marks the unused slots.
+        self.codon_to_aa_idx = np.full(64, -1, dtype=np.int8)
+        for codon in self.codons:
+            self.codon_to_aa_idx[codon_index(
+                codon)] = self.aa_index[self.codon_to_aa[codon]]
+        used = self.codon_to_aa_idx >= 0
+        self.max_freq_by_aa = np.zeros(len(self.aa_list), dtype=np.float32)
+        np.maximum.at(self.max_freq_by_aa,
+                      self.codon_to_aa_idx[used], self.freq_by_idx[used])
+        # Adaptation weights (freq / max freq of the codon's AA), vectorized
+        # over the flat tables. Unused slots stay at 1.0 so log() is safe.
+        self.cai_weights = np.ones(64, dtype=np.float64)
+        self.cai_weights[used] = self.freq_by_idx[used] / \
+            self.max_freq_by_aa[self.codon_to_aa_idx[used]]
+        self.log_cai_weights = np.log(self.cai_weights)
+        # Sorted per-AA codon tuples so hot loops can index choices directly
+        # instead of building sets.
+        self.codons_tuple = {aa: tuple(sorted(codons))
+                             for aa, codons in self.aa_to_codons.items()}
+        # Per-AA codon indices in one flat array with offsets, so random CDS
+        # generation can run as a compiled loop.
+        flat = []
+        offsets = [0]
+        for aa in self.aa_list:
+            flat.extend(codon_index(c) for c in self.codons_tuple[aa])
+            offsets.append(len(flat))
+        self.aa_codon_flat = np.array(flat, dtype=np.uint8)
+        self.aa_codon_offsets = np.array(offsets, dtype=np.int32)
+        # Sorted-within-AA slot of each codon, so hot loops can exclude the
+        # current codon from a draw with an index fixup instead of a retry.
+        self.codon_to_slot = np.full(64, -1, dtype=np.int8)
+        for codons in self.codons_tuple.values():
+            for slot, codon in enumerate(codons):
+                self.codon_to_slot[codon_index(codon)] = slot
 
     def get_codon_freq(self, codon):
-        return self.codon_freq[codon]
+        return int(self.freq_by_idx[codon_index(codon)])
 
     def get_aa_max_freq(self, aa):
-        return self.aa_max_freq[aa]
+        return int(self.max_freq_by_aa[self.aa_index[aa]])
 
     def get_codons(self, aa) -> set[str]:
         return self.aa_to_codons[aa]
@@ -76,20 +179,44 @@ class CodonFrequencyTable:
     def get_aa(self, codon):
         return self.codon_to_aa[codon]
 
+    def get_aa_idx(self, codon_idx) -> int:
+        """AA index (into aa_list) for a 6-bit codon index; -1 if unused."""
+        return int(self.codon_to_aa_idx[codon_idx])
+
+    def get_codon_freq_by_idx(self, codon_idx) -> int:
+        return int(self.freq_by_idx[codon_idx])
+
+    def codon_adaption_weight_by_idx(self, codon_idx) -> float:
+        return float(self.cai_weights[codon_idx])
+
+    def aa_indices(self, aa_seq) -> np.ndarray:
+        """Encodes an AA sequence as an int32 array of per-table AA indices."""
+        return np.array([self.aa_index[aa] for aa in aa_seq], dtype=np.int32)
+
     def codon_adaption_weight(self, codon):
-        return self.get_codon_freq(codon) / self.get_aa_max_freq(self.get_aa(codon))
+        return float(self.cai_weights[codon_index(codon)])
 
     def codon_adaptation_index(self, cds) -> float:
-        cai = 1
-        for codon in cds:
-            cai *= self.codon_adaption_weight(codon)
-        return cai**(1/len(cds))
+        return math.exp(self.log_codon_adaptation_index(cds))
 
     def log_codon_adaptation_index(self, cds):
-        cai = 0
-        for codon in cds:
-            cai += math.log(self.codon_adaption_weight(codon))
-        return cai / len(cds)
+        return _log_cai(as_codon_indices(cds), self.cai_weights)
+
+    def batch_log_codon_adaptation_index(self, batch: np.ndarray) -> np.ndarray:
+        """Log-CAI for a (K, L) batch of packed CDSs as one gather + reduce."""
+        return self.log_cai_weights[batch].sum(axis=1) / batch.shape[1]
+
+    def evaluate_neighborhood(self, cds: np.ndarray, i: int):
+        """Scores every codon choice at position i of a packed CDS.
+
+        Returns (codon indices, log-CAI per choice), letting a walk pick the
+        best neighbor in one batched evaluation instead of sampling."""
+        aa_idx = self.codon_to_aa_idx[cds[i]]
+        lo, hi = self.aa_codon_offsets[aa_idx], self.aa_codon_offsets[aa_idx+1]
+        choices = self.aa_codon_flat[lo:hi]
+        batch = np.tile(cds, (len(choices), 1))
+        batch[:, i] = choices
+        return choices, self.batch_log_codon_adaptation_index(batch)
 
 
 @dataclasses.dataclass
@@ -115,23 +242,22 @@ def read_cds(tsv_path):
     return cds
 
 
-def random_cds(aa_seq, freq_table) -> list[str]:
-    import random
-    cds = []
-    for aa in aa_seq:
-        cds.append(random.choice(list(freq_table.aa_to_codons[aa])))
-    return cds
+def random_cds(aa_seq, freq_table, rng=None) -> np.ndarray:
+    if rng is None:
+        import random
+        rng = random
+    # The compiled kernel draws from numba's own generator; seed it from the
+    # caller's rng so seeded walks stay reproducible.
+    return _random_cds(freq_table.aa_indices(aa_seq),
+                       freq_table.aa_codon_offsets,
+                       freq_table.aa_codon_flat,
+                       rng.getrandbits(32))
 
 
-def encode_cds_one_hot(cds: list[str], freq_table: CodonFrequencyTable) -> list[list[float]]:
-    width = freq_table.max_codons()
-    res = []
-    for codon in cds:
-        enc = [0.0 for _ in range(width)]
-        codons = sorted(freq_table.get_codons(freq_table.get_aa(codon)))
-        enc[codons.index(codon)] = 1.0
-        res.append(enc)
-    return res
+def encode_cds_one_hot(cds, freq_table: CodonFrequencyTable) -> np.ndarray:
+    """One-hot (L, max_codons) encoding of a CDS by sorted-within-AA slot."""
+    slots = freq_table.codon_to_slot[as_codon_indices(cds)]
+    return np.eye(freq_table.max_codons(), dtype=np.float32)[slots]
 
 
 def main():
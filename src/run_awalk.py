@@ -1,5 +1,9 @@
 """A script to run an adaptive walk to find an mRNA coding sequence (CDS) for a given protein."""
+import concurrent.futures
+import multiprocessing
+import os
 import pickle
+import random
 import protein
 import awalk
 import objective_functions as objectives
@@ -7,6 +11,17 @@ import argparse
 import vienna
 
 
+def run_walk(aa_seq, freq_table, stability, obj_config, steps, init_cds, verbose, seed,
+             neighbor_workers=0):
+    """Runs a single adaptive walk. Builds the objective here so the
+    arguments stay picklable for process-pool workers."""
+    obj = objectives.make_objective(stability, obj_config)
+    walk_config = awalk.WalkConfig(
+        aa_seq, freq_table, obj, steps, init_cds=init_cds, verbose=verbose,
+        seed=seed, neighbor_workers=neighbor_workers)
+    return awalk.adaptive_random_walk(walk_config)
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--steps', type=int, default=1000,
@@ -21,6 +36,12 @@ def main():
                     help='Objective function forces CAI to be at least this')
     ap.add_argument('--cai_exp_scale', type=float, default=1.0,
                     help='Scaling factor for CAI. Increase to make CAI more important')
+    ap.add_argument('--restarts', type=int, default=1,
+                    help='Number of independent walks to run. The best result is kept.')
+    ap.add_argument('--workers', type=int, default=None,
+                    help='Number of worker processes for parallel restarts. Defaults to one per restart, capped at the CPU count.')
+    ap.add_argument('--neighbor_workers', type=int, default=0,
+                    help='If > 0, each step scores every codon choice at the mutated position (steepest ascent) with this many threads running ViennaRNA in parallel.')
     ap.add_argument("--save_path", type=str, default=None,
                     help="The path to save the result. Saved in pickle format.")
     ap.add_argument("--verbose", action="store_true", help="Log all progress")
@@ -34,14 +55,6 @@ def main():
     obj_config = objectives.CAIThresholdObjectiveConfig(
         freq_table, args.cai_threshold, args.cai_exp_scale, verbose=args.verbose)
 
-    # Get obj function
-    if args.stability == 'aup':
-        obj = objectives.make_cai_and_aup_obj(obj_config)
-    elif args.stability == 'efe':
-        obj = objectives.make_cai_and_efe_obj(obj_config)
-    elif args.stability == 'none':
-        obj = objectives.make_cai_threshold_obj(obj_config)
-
     # Load initial CDS if specified
     init_cds = None
     if args.load_path is not None:
@@ -49,12 +62,26 @@ def main():
         with open(args.load_path, "rb") as f:
             init_cds = pickle.load(f).cds
 
-    # Create walk config
-    walk_config = awalk.WalkConfig(
-        args.aa_seq, freq_table, obj, args.steps, init_cds=init_cds, verbose=args.verbose)
-
-    # Run walker
-    res = awalk.adapative_random_walk(walk_config)
+    if args.restarts > 1:
+        # Walks are independent, so run them in parallel processes and keep
+        # the best. Spawned processes give each worker its own ViennaRNA state.
+        workers = args.workers if args.workers is not None else min(
+            args.restarts, os.cpu_count())
+        seeds = random.sample(range(2**31), args.restarts)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(
+                run_walk, args.aa_seq, freq_table, args.stability, obj_config,
+                args.steps, init_cds, args.verbose, seed,
+                args.neighbor_workers) for seed in seeds]
+            results = [f.result()
+                       for f in concurrent.futures.as_completed(futures)]
+        res = max(results, key=lambda r: r.fitness)
+    else:
+        res = run_walk(args.aa_seq, freq_table, args.stability, obj_config,
+                       args.steps, init_cds, args.verbose, None,
+                       args.neighbor_workers)
 
     # Output results
     cai = freq_table.codon_adaptation_index(res.cds)
@@ -62,7 +89,7 @@ def main():
     print(
         f"Adaptive walk result for {args.aa_seq} with {args.stability} objective and {args.steps} steps:")
     print(
-        f"Result CDS: {res.cds} \n\t Fitness: {res.fitness}, CAI: {cai}, AUP: {aup}, EFE: {efe}")
+        f"Result CDS: {protein.decode_cds(res.cds)} \n\t Fitness: {res.fitness}, CAI: {cai}, AUP: {aup}, EFE: {efe}")
 
     # Save the result as pickle
     if args.save_path is not None:
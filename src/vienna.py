@@ -1,17 +1,36 @@
 """Interface to ViennaRNA package"""
+import functools
 from typing import Tuple
+import numpy as np
+import protein
 import RNA
 
 
-class ViennaContext:
-    def __init__(self, rna, temp=None, dangles=2, noLPs=False) -> None:
+# Model-details objects reused across fold compounds; contexts are created
+# per objective call, so rebuilding RNA.md() every time is avoidable work.
+# fold_compound itself cannot be reused: ViennaRNA's Python API has no safe
+# sequence reassignment for single-sequence compounds (sequence_remove_all/
+# sequence_add crashes them).
+_md_cache = {}
+
+
+def _model_details(temp, dangles, noLPs):
+    key = (temp, dangles, noLPs)
+    md = _md_cache.get(key)
+    if md is None:
         md = RNA.md()
         md.uniq_ML = 1
         md.dangles = dangles
         md.noLP = noLPs
         if temp is not None:
             md.temperature = temp
-        self.fc = RNA.fold_compound(rna, md)
+        _md_cache[key] = md
+    return md
+
+
+class ViennaContext:
+    def __init__(self, rna, temp=None, dangles=2, noLPs=False) -> None:
+        self.fc = RNA.fold_compound(rna, _model_details(temp, dangles, noLPs))
         self.pf_computed = False
 
     def __ensure_pf(self):
@@ -30,21 +49,22 @@ class ViennaContext:
         self.__ensure_pf()
         return self.fc.pr_structure(ss)
 
-    def make_bppt(self) -> list[list[float]]:
+    def make_bppt(self) -> np.ndarray:
         self.__ensure_pf()
-        bpp = self.fc.bpp()
-        sz = self.fc.length
-        res = [[0.0 for _ in range(sz)] for _ in range(sz)]
-        for i in range(sz):
-            for j in range(sz):
-                if j < i:
-                    res[i][j] = bpp[j+1][i+1]
-                elif i < j:
-                    res[i][j] = bpp[i+1][j+1]
-        for i in range(sz):
-            res[i][i] = 1-sum(res[i])
+        # Vienna's bpp() is 1-indexed with pair probabilities in the upper
+        # triangle; symmetrize in numpy instead of a Python double loop.
+        bpp = np.asarray(self.fc.bpp())[1:, 1:]
+        res = bpp + bpp.T
+        np.fill_diagonal(res, 1 - res.sum(axis=1))
         return res
 
+    def unpaired_probs(self) -> np.ndarray:
+        """Per-position unpaired probabilities without materializing the LxL table."""
+        self.__ensure_pf()
+        bpp = np.asarray(self.fc.bpp())
+        paired = bpp.sum(axis=0) + bpp.sum(axis=1)
+        return 1 - paired[1:]
+
     def ensemble_free_energy(self):
         self.__ensure_pf()
         return self.efe
@@ -65,23 +85,32 @@ class ViennaContext:
         return self.fc.pbacktrack(samples, RNA.PBACKTRACK_DEFAULT if redundant else RNA.PBACKTRACK_NON_REDUNDANT)
 
 
-def ensemble_unpaired(bppt: list[list[float]]):
-    return sum([bppt[i][i] for i in range(len(bppt))])
+def ensemble_unpaired(bppt: np.ndarray):
+    return float(np.trace(bppt))
 
 
+# The partition function dominates objective cost and adaptive walks
+# re-evaluate recently seen sequences (e.g. after rejected mutations), so
+# cache results keyed by the RNA string.
+@functools.lru_cache(maxsize=4096)
 def average_unpaired(rna_seq: str) -> float:
     ctx = ViennaContext(rna_seq)
-    return ensemble_unpaired(ctx.make_bppt())/len(rna_seq)
+    return float(ctx.unpaired_probs().sum())/len(rna_seq)
 
 
+@functools.lru_cache(maxsize=4096)
 def ensemble_free_energy(rna_seq: str) -> float:
     ctx = ViennaContext(rna_seq)
     return ctx.ensemble_free_energy()
 
+
+@functools.lru_cache(maxsize=4096)
 def aup_and_efe(rna_seq: str) -> Tuple[float, float]:
     ctx = ViennaContext(rna_seq)
-    return ensemble_unpaired(ctx.make_bppt())/len(rna_seq), ctx.ensemble_free_energy()
+    return float(ctx.unpaired_probs().sum())/len(rna_seq), ctx.ensemble_free_energy()
 
 
 def cds_to_rna(cds):
+    if isinstance(cds, np.ndarray):
+        return protein.CODON_BYTES[cds].tobytes().decode('ascii')
     return ''.join(cds)